@@ -1,26 +1,84 @@
+from __future__ import annotations
+
 import argparse
+import functools
 import logging
 import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any
+
+from board_game_merger.sites import items_for, site_items
 
-from board_game_merger.config import MergeConfig
-from board_game_merger.merge import merge_files
+if TYPE_CHECKING:
+    from collections.abc import Generator
+
+    from board_game_merger.config import MergeConfig
 
 LOGGER = logging.getLogger(__name__)
+_LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+_ITEM_TYPES = frozenset(("GameItem", "RatingItem", "UserItem"))
 
+_STORE_TRUE = "store_true"
+_NARGS_PLUS = "nargs+"
 
-def _parse_args() -> argparse.Namespace:
+# Option string -> (destination, value type or action)
+_OPTIONS: dict[str, tuple[str, Any]] = {
+    "--item-type": ("item_type", str),
+    "-t": ("item_type", str),
+    "--in-paths": ("in_paths", _NARGS_PLUS),
+    "-i": ("in_paths", _NARGS_PLUS),
+    "--out-path": ("out_path", str),
+    "-o": ("out_path", str),
+    "--clean-results": ("clean_results", _STORE_TRUE),
+    "-c": ("clean_results", _STORE_TRUE),
+    "--latest-min-days": ("latest_min_days", float),
+    "-m": ("latest_min_days", float),
+    "--overwrite": ("overwrite", _STORE_TRUE),
+    "-W": ("overwrite", _STORE_TRUE),
+    "--progress-bar": ("progress_bar", _STORE_TRUE),
+    "-p": ("progress_bar", _STORE_TRUE),
+    "--verbose": ("verbose", _STORE_TRUE),
+    "-v": ("verbose", _STORE_TRUE),
+    "--workers": ("workers", int),
+    "-j": ("workers", int),
+    "--batch-size": ("batch_size", int),
+    "-b": ("batch_size", int),
+    "--low-memory": ("low_memory", _STORE_TRUE),
+    "-l": ("low_memory", _STORE_TRUE),
+}
+
+_DEFAULTS: dict[str, Any] = {
+    "item_type": "GameItem",
+    "in_paths": None,
+    "out_path": None,
+    "clean_results": False,
+    "latest_min_days": None,
+    "overwrite": False,
+    "progress_bar": False,
+    "verbose": False,
+    "workers": 1,
+    "batch_size": 65_536,
+    "low_memory": False,
+}
+
+
+@functools.cache
+def _build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Merge board game data files")
 
     parser.add_argument(
-        "site",
-        help="Site to merge data from",
+        "sites",
+        nargs="+",
+        help="Sites to merge data from, or 'all' for all sites and item types",
     )
     parser.add_argument(
         "--item-type",
         "-t",
-        choices=("GameItem", "RatingItem", "UserItem"),
         default="GameItem",
-        help="Type of item to merge",
+        help="Type of item to merge: GameItem (default), RatingItem, or UserItem",
     )
     parser.add_argument(
         "--in-paths",
@@ -64,46 +122,231 @@ def _parse_args() -> argparse.Namespace:
         action="store_true",
         help="Enable verbose logging",
     )
+    parser.add_argument(
+        "--workers",
+        "-j",
+        type=int,
+        default=1,
+        help="Number of merges to run in parallel processes",
+    )
+    parser.add_argument(
+        "--batch-size",
+        "-b",
+        type=int,
+        default=65_536,
+        help="Number of rows to parse per batch when reading input files",
+    )
+    parser.add_argument(
+        "--low-memory",
+        "-l",
+        action="store_true",
+        help="Reduce memory usage when reading input files, at the expense of speed",
+    )
 
-    return parser.parse_args()
+    return parser
 
 
-def main() -> None:
-    args = _parse_args()
+def _split_arg(arg: str) -> tuple[str, ...]:
+    """Split ``--option=value`` and bundled short flags like ``-cW``."""
 
-    logging.basicConfig(
-        level=logging.DEBUG if args.verbose else logging.INFO,
-        format="%(asctime)s [%(levelname)s] %(message)s",
-        stream=sys.stdout,
-    )
+    if arg.startswith("--"):
+        option, sep, value = arg.partition("=")
+        kind = _OPTIONS.get(option, ("", None))[1]
+        # Leave other uses of "=" to argparse, which treats them differently
+        if sep and kind not in (None, _STORE_TRUE, _NARGS_PLUS):
+            return option, value
+        return (arg,)
 
-    merge_configs = (
-        tuple(
-            MergeConfig.all_sites_config(
-                clean_results=args.clean_results, latest_min_days=args.latest_min_days
-            )
+    flags = arg[1:]
+    if (
+        arg.startswith("-")
+        and len(flags) > 1
+        and all(
+            _OPTIONS.get(f"-{flag}", ("", None))[1] == _STORE_TRUE for flag in flags
         )
-        if args.site == "all"
-        else (
-            MergeConfig.site_config(
-                site=args.site,
-                item=args.item_type,
-                in_paths=args.in_paths,
-                out_path=args.out_path,
+    ):
+        return tuple(f"-{flag}" for flag in flags)
+
+    return (arg,)
+
+
+def _parse_args_fast(argv: list[str]) -> SimpleNamespace | None:
+    """
+    Scan the arguments in a single pass. Return None if they cannot be handled
+    without the full parser, i.e., help or invalid arguments.
+    """
+
+    argv = [token for arg in argv for token in _split_arg(arg)]
+    values = dict(_DEFAULTS)
+    positionals = []
+    positional_indexes = []
+    num_args = len(argv)
+    i = 0
+
+    while i < num_args:
+        arg = argv[i]
+        i += 1
+
+        if not arg.startswith("-"):
+            positionals.append(arg)
+            positional_indexes.append(i - 1)
+            continue
+
+        option = _OPTIONS.get(arg)
+        if option is None:
+            return None
+
+        dest, kind = option
+
+        if kind == _STORE_TRUE:
+            values[dest] = True
+            continue
+
+        start = i
+        while i < num_args and not argv[i].startswith("-"):
+            i += 1
+        if kind != _NARGS_PLUS:
+            i = min(i, start + 1)
+
+        if i == start:
+            return None
+
+        try:
+            values[dest] = argv[start:i] if kind == _NARGS_PLUS else kind(argv[start])
+        except ValueError:
+            return None
+
+    # Like argparse, only accept sites given as one run of arguments
+    if not positionals or positional_indexes[-1] - positional_indexes[0] >= len(
+        positionals
+    ):
+        return None
+
+    values["sites"] = positionals
+
+    return SimpleNamespace(**values)
+
+
+def _parse_args(argv: list[str] | None = None) -> SimpleNamespace:
+    argv = sys.argv[1:] if argv is None else argv
+    args = _parse_args_fast(argv)
+    if args is None:
+        # Only help and invalid arguments need argparse's machinery
+        args = SimpleNamespace(**vars(_build_parser().parse_args(argv)))
+
+    if args.item_type not in _ITEM_TYPES:
+        _build_parser().error(
+            f"argument --item-type/-t: invalid choice: {args.item_type!r} "
+            f"(choose from {', '.join(sorted(_ITEM_TYPES))})",
+        )
+
+    for option, value in (
+        ("--workers/-j", args.workers),
+        ("--batch-size/-b", args.batch_size),
+    ):
+        if value < 1:
+            _build_parser().error(f"argument {option}: must be positive: {value}")
+
+    if "all" in args.sites:
+        if len(args.sites) > 1:
+            _build_parser().error("'all' cannot be combined with other sites")
+    else:
+        # Report all invalid combinations before any merge starts
+        invalid = [site for site in args.sites if args.item_type not in items_for(site)]
+        if invalid:
+            _build_parser().error(
+                f"argument --item-type/-t: {args.item_type} is not available for "
+                f"{', '.join(invalid)}",
+            )
+
+    if (args.in_paths or args.out_path) and (
+        len(args.sites) > 1 or "all" in args.sites
+    ):
+        _build_parser().error("--in-paths and --out-path require a single site")
+
+    return args
+
+
+def _site_configs(args: SimpleNamespace) -> Generator[MergeConfig, None, None]:
+    from board_game_merger.config import MergeConfig
+    from board_game_merger.merge import skip_existing
+
+    pairs = (
+        site_items()
+        if "all" in args.sites
+        else ((site, args.item_type) for site in args.sites)
+    )
+
+    # Share one timestamp across all configs, but only get it if it's used
+    now = (
+        datetime.now(timezone.utc)
+        if (args.out_path is None and not args.clean_results) or args.latest_min_days
+        else None
+    )
+
+    for site, item in pairs:
+        out_path = Path(
+            args.out_path
+            or MergeConfig.default_out_path(
+                site,
+                item=item,
                 clean_results=args.clean_results,
-                latest_min_days=args.latest_min_days,
+                now=now,
             ),
         )
+        # Check before building the config, which isn't needed if skipped
+        if skip_existing(out_path, overwrite=args.overwrite):
+            continue
+
+        yield MergeConfig.site_config(
+            site=site,
+            item=item,
+            in_paths=args.in_paths,
+            out_path=out_path,
+            clean_results=args.clean_results,
+            latest_min_days=args.latest_min_days,
+            now=now,
+        )
+
+
+def main() -> None:
+    args = _parse_args()
+
+    # Import here so --help and argument errors don't pay for loading polars
+    from board_game_merger.merge import (
+        merge_files,
+        merge_files_parallel,
     )
 
-    for merge_config in merge_configs:
-        merge_files(
-            merge_config=merge_config,
-            overwrite=args.overwrite,
-            drop_empty=True,
-            sort_keys=bool(args.clean_results),
-            progress_bar=bool(args.progress_bar),
+    log_level = logging.DEBUG if args.verbose else logging.INFO
+    # Leave logging alone if main() is called from code that configured it
+    if not logging.getLogger().hasHandlers():
+        logging.basicConfig(level=log_level, format=_LOG_FORMAT, stream=sys.stdout)
+
+    # Lazily build each config right before it's merged
+    merge_configs = _site_configs(args)
+
+    merge_kwargs = {
+        "overwrite": args.overwrite,
+        "drop_empty": True,
+        "sort_keys": bool(args.clean_results),
+        "progress_bar": bool(args.progress_bar),
+        "batch_size": args.batch_size,
+        "low_memory": bool(args.low_memory),
+    }
+
+    if args.workers > 1:
+        merge_files_parallel(
+            merge_configs=merge_configs,
+            max_workers=args.workers,
+            log_level=log_level,
+            log_format=_LOG_FORMAT,
+            **merge_kwargs,
         )
+        return
+
+    for merge_config in merge_configs:
+        merge_files(merge_config=merge_config, **merge_kwargs)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import dataclasses
+import functools
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import TYPE_CHECKING, Any, Literal
@@ -8,18 +9,66 @@ from typing import TYPE_CHECKING, Any, Literal
 import polars as pl
 
 from board_game_merger.schemas import ITEM_TYPE_SCHEMA
+from board_game_merger.sites import site_items
 
 if TYPE_CHECKING:
-    from collections.abc import Generator
+    from collections.abc import Callable, Generator, Mapping
 
-    from polars._typing import IntoExpr
+    from polars._typing import IntoExpr, PolarsDataType
 
-PROJECT_DIR = Path(__file__).resolve().parent.parent.parent
+# absolute() only prepends the working directory if needed, unlike resolve() it
+# doesn't stat every path component
+PROJECT_DIR = Path(__file__).absolute().parent.parent.parent
 FEEDS_DIR = PROJECT_DIR.parent / "board-game-scraper" / "feeds"
 DATA_DIR = PROJECT_DIR.parent / "board-game-data"
 
+# Plain strings, so default paths are built with a single f-string each
+_FEEDS_DIR_STR = str(FEEDS_DIR)
+_DATA_DIR_STR = str(DATA_DIR)
 
-@dataclasses.dataclass(frozen=True, kw_only=True)
+
+@functools.cache
+def _scraped_at_utc() -> pl.Expr:
+    return pl.col("scraped_at").str.to_datetime(time_zone="UTC")
+
+
+@functools.cache
+def _published_at_utc() -> pl.Expr:
+    return pl.col("published_at").str.to_datetime(time_zone="UTC")
+
+
+@functools.cache
+def _bgg_user_lower() -> pl.Expr:
+    return pl.col("bgg_user_name").str.to_lowercase()
+
+
+# Keys of BGG items other than games, user names are compared in lowercase
+_BGG_KEY_COLS: dict[str, tuple[str, ...]] = {
+    "UserItem": ("bgg_user_name",),
+    "RatingItem": ("bgg_user_name", "bgg_id"),
+}
+
+
+@functools.cache
+def _bgg_key_col(item: str) -> tuple[IntoExpr, ...]:
+    return tuple(
+        _bgg_user_lower() if col == "bgg_user_name" else col
+        for col in _BGG_KEY_COLS[item]
+    )
+
+
+@functools.cache
+def _defaults_for(site: str, item: str) -> tuple[pl.Schema | None, str, str, pl.Expr]:
+    """Default schema, in_paths, key_col, and latest_col for a site and item."""
+    return (
+        ITEM_TYPE_SCHEMA.get(item),
+        f"{_FEEDS_DIR_STR}/{site}/{item}",
+        f"{site}_id",
+        _scraped_at_utc(),
+    )
+
+
+@dataclasses.dataclass(frozen=True, kw_only=True, slots=True)
 class MergeConfig:
     schema: pl.Schema
 
@@ -42,51 +91,82 @@ class MergeConfig:
         site: str,
         *,
         item: Literal["GameItem", "UserItem", "RatingItem"] = "GameItem",
-        schema: pl.Schema | None = None,
+        schema: pl.Schema | Mapping[str, PolarsDataType] | None = None,
         in_paths: str | Path | list[str] | list[Path] | None = None,
         out_path: str | Path | None = None,
         key_col: IntoExpr | list[IntoExpr] | None = None,
         latest_col: IntoExpr | list[IntoExpr] | None = None,
         clean_results: bool = False,
         latest_min_days: float | None = None,
+        now: datetime | None = None,
         **kwargs: Any,
     ) -> MergeConfig:
-        now = datetime.now(timezone.utc)
-        now_str = now.strftime("%Y-%m-%dT%H-%M-%S")
-
-        kwargs["schema"] = schema if schema is not None else ITEM_TYPE_SCHEMA.get(item)
-
-        if not kwargs["schema"]:
+        (
+            default_schema,
+            default_in_paths,
+            default_key_col,
+            default_latest_col,
+        ) = _defaults_for(site, item)
+
+        if schema is None:
+            schema = default_schema
+        elif not isinstance(schema, pl.Schema):
+            # Convert once here, so scan_ndjson always receives a pl.Schema
+            schema = pl.Schema(schema)
+        kwargs["schema"] = schema
+
+        if not schema:
             raise ValueError(f"Unknown item type: {item}")
 
-        kwargs["in_paths"] = in_paths or (FEEDS_DIR / site / item)
+        kwargs["in_paths"] = in_paths or default_in_paths
 
-        kwargs["key_col"] = key_col if key_col is not None else f"{site}_id"
+        kwargs["key_col"] = key_col if key_col is not None else default_key_col
         kwargs["latest_col"] = (
-            latest_col
-            if latest_col is not None
-            else pl.col("scraped_at").str.to_datetime(time_zone="UTC")
+            latest_col if latest_col is not None else default_latest_col
+        )
+        # Plain membership checks instead of setdefault, which would evaluate
+        # its default even when the caller supplied a value
+        if "latest_min" not in kwargs and latest_min_days and latest_min_days > 0:
+            now = now or datetime.now(timezone.utc)
+            kwargs["latest_min"] = now - timedelta(days=latest_min_days)
+
+        kwargs["out_path"] = out_path or cls.default_out_path(
+            site,
+            item=item,
+            clean_results=clean_results,
+            now=now,
         )
-        if latest_min_days and latest_min_days > 0:
-            kwargs.setdefault("latest_min", now - timedelta(days=latest_min_days))
 
         if clean_results:
-            kwargs["out_path"] = out_path or (
-                DATA_DIR / "scraped" / f"{site}_{item}.jl"
-            )
-            kwargs.setdefault("sort_fields", kwargs["key_col"])
-            kwargs.setdefault(
-                "fieldnames_exclude",
-                ["published_at", "updated_at", "scraped_at"],
-            )
-
-        else:
-            kwargs["out_path"] = out_path or (
-                FEEDS_DIR / site / item / f"{now_str}-merged.jl"
-            )
+            if "sort_fields" not in kwargs:
+                kwargs["sort_fields"] = kwargs["key_col"]
+            if "fieldnames_exclude" not in kwargs:
+                kwargs["fieldnames_exclude"] = [
+                    "published_at",
+                    "updated_at",
+                    "scraped_at",
+                ]
 
         return cls(**kwargs)
 
+    @classmethod
+    def default_out_path(
+        cls,
+        site: str,
+        *,
+        item: Literal["GameItem", "UserItem", "RatingItem"] = "GameItem",
+        clean_results: bool = False,
+        now: datetime | None = None,
+    ) -> Path:
+        """Output path used by with_defaults, without building the full config."""
+
+        if clean_results:
+            return Path(f"{_DATA_DIR_STR}/scraped/{site}_{item}.jl")
+
+        now = now or datetime.now(timezone.utc)
+        now_str = now.strftime("%Y-%m-%dT%H-%M-%S")
+        return Path(f"{_FEEDS_DIR_STR}/{site}/{item}/{now_str}-merged.jl")
+
     @classmethod
     def site_config(
         cls,
@@ -95,15 +175,13 @@ class MergeConfig:
         item: Literal["GameItem", "UserItem", "RatingItem"] = "GameItem",
         **kwargs: Any,
     ) -> MergeConfig:
-        if site == "bgg":
-            return cls.bgg_config(item=item, **kwargs)
+        builder = _SITE_BUILDERS.get(site)
+        if builder is not None:
+            return builder(item=item, **kwargs)
 
         if item != "GameItem":
             raise ValueError(f"Unknown item type for site <{site}>: {item}")
 
-        if site == "bgg_hotness":
-            return cls.bgg_hotness_config(**kwargs)
-
         return cls.with_defaults(site=site, item="GameItem", **kwargs)
 
     @classmethod
@@ -114,71 +192,50 @@ class MergeConfig:
         clean_results: bool = False,
         **kwargs: Any,
     ) -> MergeConfig:
-        if item == "GameItem":
-            return cls.with_defaults(
-                site="bgg",
-                item="GameItem",
-                clean_results=clean_results,
-                **kwargs,
-            )
-
-        if item == "UserItem":
-            kwargs.setdefault("key_col", pl.col("bgg_user_name").str.to_lowercase())
-            if clean_results:
-                kwargs.setdefault("fieldnames_exclude", ["published_at", "scraped_at"])
-            return cls.with_defaults(
-                site="bgg",
-                item="UserItem",
-                clean_results=clean_results,
-                **kwargs,
-            )
-
-        if item == "RatingItem":
-            kwargs.setdefault(
-                "key_col",
-                [pl.col("bgg_user_name").str.to_lowercase(), "bgg_id"],
-            )
-            if clean_results:
-                kwargs.setdefault("fieldnames_exclude", ["published_at", "scraped_at"])
-            return cls.with_defaults(
-                site="bgg",
-                item="RatingItem",
-                clean_results=clean_results,
-                **kwargs,
-            )
-
-        raise ValueError(f"Unknown item type: {item}")
+        if item != "GameItem":
+            if item not in _BGG_KEY_COLS:
+                raise ValueError(f"Unknown item type: {item}")
+
+            if "key_col" not in kwargs:
+                kwargs["key_col"] = list(_bgg_key_col(item))
+            if clean_results and "fieldnames_exclude" not in kwargs:
+                kwargs["fieldnames_exclude"] = ["published_at", "scraped_at"]
+
+        return cls.with_defaults(
+            site="bgg",
+            item=item,
+            clean_results=clean_results,
+            **kwargs,
+        )
 
     @classmethod
     def bgg_hotness_config(
         cls,
         *,
+        item: Literal["GameItem", "UserItem", "RatingItem"] = "GameItem",
         clean_results: bool = False,
         **kwargs: Any,
     ) -> MergeConfig:
-        kwargs.setdefault(
-            "key_col",
-            [pl.col("published_at").str.to_datetime(time_zone="UTC"), "bgg_id"],
-        )
-        kwargs.setdefault(
-            "sort_fields",
-            [pl.col("published_at").str.to_datetime(time_zone="UTC"), "rank"],
-        )
-        kwargs.setdefault("fieldnames_exclude", None)
-
-        if clean_results:
-            kwargs.setdefault(
-                "fieldnames_include",
-                [
-                    "published_at",
-                    "rank",
-                    "add_rank",
-                    "bgg_id",
-                    "name",
-                    "year",
-                    "image_url",
-                ],
-            )
+        if item != "GameItem":
+            raise ValueError(f"Unknown item type for site <bgg_hotness>: {item}")
+
+        if "key_col" not in kwargs:
+            kwargs["key_col"] = [_published_at_utc(), "bgg_id"]
+        if "sort_fields" not in kwargs:
+            kwargs["sort_fields"] = [_published_at_utc(), "rank"]
+        if "fieldnames_exclude" not in kwargs:
+            kwargs["fieldnames_exclude"] = None
+
+        if clean_results and "fieldnames_include" not in kwargs:
+            kwargs["fieldnames_include"] = [
+                "published_at",
+                "rank",
+                "add_rank",
+                "bgg_id",
+                "name",
+                "year",
+                "image_url",
+            ]
 
         return cls.with_defaults(
             site="bgg_hotness",
@@ -194,18 +251,15 @@ class MergeConfig:
         sites: list[str] | None = None,
         **kwargs: Any,
     ) -> Generator[MergeConfig, None, None]:
-        sites = sites or [
-            "bgg_hotness",
-            "dbpedia",
-            "luding",
-            "spielen",
-            "wikidata",
-            "bgg",
-        ]
-        for site in sites:
-            if site == "bgg":
-                yield cls.site_config(site=site, item="GameItem", **kwargs)
-                yield cls.site_config(site=site, item="UserItem", **kwargs)
-                yield cls.site_config(site=site, item="RatingItem", **kwargs)
-            else:
-                yield cls.site_config(site=site, item="GameItem", **kwargs)
+        # Share one timestamp across all configs of this run
+        if kwargs.get("now") is None:
+            kwargs["now"] = datetime.now(timezone.utc)
+        for site, item in site_items(sites):
+            yield cls.site_config(site=site, item=item, **kwargs)
+
+
+# Sites with their own config builder, all others use with_defaults
+_SITE_BUILDERS: dict[str, Callable[..., MergeConfig]] = {
+    "bgg": MergeConfig.bgg_config,
+    "bgg_hotness": MergeConfig.bgg_hotness_config,
+}
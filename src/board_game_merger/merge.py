@@ -1,28 +1,364 @@
 from __future__ import annotations
 
+import functools
 import json
 import logging
-import tempfile
+import multiprocessing
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
 
 import polars as pl
 from tqdm import tqdm
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment]
+
 if TYPE_CHECKING:
+    from collections.abc import Callable, Generator, Iterable, Sequence
+    from concurrent.futures import Future
+
+    from polars._typing import IntoExpr, PolarsDataType
+
     from board_game_merger.config import MergeConfig
 
 LOGGER = logging.getLogger(__name__)
 MAX_DISPLAY_ITEMS = 10
+# Rows are short, so buffer writes well beyond the default 8 KiB
+WRITE_BUFFER_SIZE = 1 << 20
+# Rows are converted to Python and serialized in chunks of this size
+DUMPS_CHUNK_ROWS = 10_000
+# Without orjson, serializing large results is spread over processes
+PARALLEL_DUMPS_MIN_ROWS = 100_000
+
+
+def skip_existing(out_path: Path, *, overwrite: bool) -> bool:
+    """Whether to skip a merge because its output exists and mustn't be replaced."""
+
+    if overwrite or not out_path.exists():
+        return False
+
+    LOGGER.warning(
+        "Output file <%s> already exists, use overwrite to replace it",
+        out_path,
+    )
+    return True
+
+
+def _make_dumps(nullable: Sequence[str]) -> Callable[[dict[str, Any]], bytes]:
+    """
+    Function serializing a row as a UTF-8 encoded JSON line, using orjson if
+    installed, and leaving out nulls in the given columns. The combination is
+    resolved once, so the returned function doesn't branch per row.
+    """
+
+    if orjson is not None:
+        dumps = functools.partial(orjson.dumps, option=orjson.OPT_APPEND_NEWLINE)
+    else:
+        # Same output as orjson (compact, raw UTF-8), except for the formatting
+        # of some floats, e.g., 1e-05 instead of 0.00001. Both parse the same.
+        encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+        def dumps(row: dict[str, Any]) -> bytes:
+            return f"{encode(row)}\n".encode()
+
+    if not nullable:
+        return dumps
+
+    def dumps_non_null(row: dict[str, Any]) -> bytes:
+        # Rows are fresh dicts, so delete in place instead of copying
+        for name in nullable:
+            if row[name] is None:
+                del row[name]
+        return dumps(row)
+
+    return dumps_non_null
+
+
+def _null_if_empty(name: str, dtype: PolarsDataType) -> pl.Expr:
+    """
+    Replace empty strings and lists with null. Zero and false are proper values
+    of numeric and boolean columns, so they are kept.
+    """
+
+    col = pl.col(name)
+    if dtype == pl.String:
+        return pl.when(col.str.len_bytes() > 0).then(col).alias(name)
+    if isinstance(dtype, pl.List):
+        return pl.when(col.list.len() > 0).then(col).alias(name)
+    return col
+
+
+def _sort_struct_fields(expr: pl.Expr, dtype: PolarsDataType) -> pl.Expr | None:
+    """
+    Reorder struct fields alphabetically, also in nested structs and lists of
+    structs. Return None if the dtype doesn't contain any structs.
+    """
+
+    if isinstance(dtype, pl.Struct):
+        fields = []
+        for field in sorted(dtype.fields, key=lambda field: field.name):
+            field_expr = expr.struct.field(field.name)
+            sorted_expr = _sort_struct_fields(field_expr, field.dtype)
+            fields.append((sorted_expr or field_expr).alias(field.name))
+        # pl.struct() would turn null values into structs of nulls
+        return pl.when(expr.is_not_null()).then(pl.struct(fields))
+
+    if isinstance(dtype, pl.List):
+        inner = _sort_struct_fields(pl.element(), dtype.inner)
+        return None if inner is None else expr.list.eval(inner)
+
+    return None
+
+
+def _sink_ndjson(data: pl.LazyFrame, *, out_path: Path) -> None:
+    """
+    Stream the results into the output file without materializing them, if
+    the installed Polars version can execute the query in streaming mode.
+    """
+
+    try:
+        data.sink_ndjson(out_path)
+    except pl.exceptions.InvalidOperationError:
+        LOGGER.debug("Query cannot be streamed, collecting results in memory")
+    else:
+        return
+
+    LOGGER.info("Collecting results, this may take a while…")
+    result = data.collect()
+    LOGGER.info("Finished collecting results with shape %dx%d", *result.shape)
+    result.write_ndjson(out_path)
+
+
+def _write_non_null(
+    data: pl.DataFrame,
+    *,
+    out_path: Path,
+    progress_bar: bool,
+) -> None:
+    """Write rows as JSON lines, leaving out null fields."""
+
+    # Columns without any values are dropped up front, and only columns with
+    # some nulls need to be checked in each row
+    num_rows = len(data)
+    null_counts = data.null_count().row(0, named=True) if num_rows else {}
+    data = data.select(name for name, count in null_counts.items() if count < num_rows)
+    nullable = [name for name, count in null_counts.items() if 0 < count < num_rows]
+
+    # Polars writes nulls, so they have to be removed row by row
+    LOGGER.info("Writing cleaned data to <%s>", out_path)
+
+    max_workers = _available_cpus()
+    chunks: Iterable[tuple[int, bytes]]
+    if (
+        orjson is None
+        and num_rows >= PARALLEL_DUMPS_MIN_ROWS
+        and max_workers > 1
+        # Don't spawn more processes from within a worker process
+        and multiprocessing.parent_process() is None
+    ):
+        chunks = _dump_non_null_parallel(data, nullable, max_workers=max_workers)
+    else:
+        chunks = (
+            (len(chunk), _dump_non_null(chunk, nullable))
+            for chunk in data.iter_slices(DUMPS_CHUNK_ROWS)
+        )
+
+    with (
+        out_path.open("wb", buffering=WRITE_BUFFER_SIZE) as out_file,
+        tqdm(
+            desc="Cleaning data",
+            unit=" rows",
+            total=num_rows,
+            disable=not progress_bar,
+        ) as pbar,
+    ):
+        for chunk_rows, chunk in chunks:
+            out_file.write(chunk)
+            pbar.update(chunk_rows)
+
+
+def _available_cpus() -> int:
+    """Number of CPUs this process may run on."""
+
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _dump_non_null(data: pl.DataFrame, nullable: list[str]) -> bytes:
+    """Serialize rows as JSON lines, leaving out nulls in the given columns."""
+
+    return b"".join(map(_make_dumps(nullable), data.to_dicts()))
+
+
+def _dump_non_null_parallel(
+    data: pl.DataFrame,
+    nullable: list[str],
+    *,
+    max_workers: int,
+) -> Generator[tuple[int, bytes], None, None]:
+    """
+    Serialize chunks of rows in a process pool, yielding the number of rows
+    and serialized chunk in order. Only a few chunks are in flight at a time.
+    """
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as executor:
+        pending: deque[tuple[int, Future[bytes]]] = deque()
+        for chunk in data.iter_slices(DUMPS_CHUNK_ROWS):
+            future = executor.submit(_dump_non_null, chunk, nullable)
+            pending.append((len(chunk), future))
+            if len(pending) > 2 * max_workers:
+                chunk_rows, future = pending.popleft()
+                yield chunk_rows, future.result()
+        while pending:
+            chunk_rows, future = pending.popleft()
+            yield chunk_rows, future.result()
 
 
-def merge_files(
+def _group_keys(key_col: Sequence[IntoExpr]) -> list[pl.Expr]:
+    """
+    Expressions to group by. Plain columns are used as they are, only computed
+    keys are added as new columns, which are dropped again after grouping.
+    """
+
+    keys = []
+    for i, key in enumerate(key_col):
+        expr = (
+            pl.col(key)
+            if isinstance(key, str)
+            else key
+            if isinstance(key, pl.Expr)
+            else pl.lit(key)
+        )
+        keys.append(expr if expr.meta.is_column() else expr.alias(f"__key__{i}"))
+    return keys
+
+
+def _latest_expr(latest_col: Sequence[IntoExpr]) -> pl.Expr:
+    """Single expression to sort by, as struct if there are several columns."""
+
+    if len(latest_col) == 1:
+        if isinstance(latest_col[0], pl.Expr):
+            return latest_col[0]
+        if isinstance(latest_col[0], str):
+            return pl.col(latest_col[0])
+    # Structs sort field by field, with nulls_last applied to each field
+    return pl.struct(latest_col)
+
+
+def _clean_exprs(
+    schema: pl.Schema,
+    *,
+    drop_empty: bool,
+    sort_keys: bool,
+) -> list[pl.Expr]:
+    """Expressions nulling empty values and sorting keys, column by column."""
+
+    columns = sorted(schema) if sort_keys else list(schema)
+    exprs = []
+    for name in columns:
+        expr = _null_if_empty(name, schema[name]) if drop_empty else pl.col(name)
+        sorted_expr = _sort_struct_fields(expr, schema[name]) if sort_keys else None
+        exprs.append(expr if sorted_expr is None else sorted_expr.alias(name))
+    return exprs
+
+
+def _root_names(exprs: Any) -> set[str] | None:
+    """
+    Names of the columns the expressions are computed from, or None if they
+    may select columns by wildcard or pattern.
+    """
+
+    names: set[str] = set()
+    for expr in exprs if isinstance(exprs, list) else [exprs]:
+        col = pl.col(expr) if isinstance(expr, str) else expr
+        if not isinstance(col, pl.Expr):
+            continue
+        if col.meta.has_multiple_outputs():
+            return None
+        names.update(col.meta.root_names())
+    return names
+
+
+def _used_columns(
+    merge_config: MergeConfig,
+    schema_names: list[str],
+) -> list[str] | None:
+    """Columns needed for the merge and the output, None if all are needed."""
+
+    if merge_config.fieldnames_include is not None:
+        output_names = _root_names(merge_config.fieldnames_include)
+    elif merge_config.fieldnames_exclude is not None:
+        excluded = _root_names(merge_config.fieldnames_exclude)
+        output_names = (
+            None if excluded is None else set(schema_names).difference(excluded)
+        )
+    else:
+        return None
+
+    if output_names is None:
+        return None
+
+    used = set(output_names)
+    for exprs in (
+        merge_config.key_col,
+        merge_config.latest_col,
+        merge_config.sort_fields,
+    ):
+        if exprs is None:
+            continue
+        names = _root_names(exprs)
+        if names is None:
+            return None
+        used.update(names)
+
+    return [name for name in schema_names if name in used]
+
+
+def _scan(
+    merge_config: MergeConfig,
+    *,
+    in_paths: list[Path],
+    batch_size: int,
+    low_memory: bool,
+) -> pl.LazyFrame:
+    """Lazily read the input files, restricted to the columns actually used."""
+
+    data = pl.scan_ndjson(
+        source=in_paths,
+        schema=merge_config.schema,
+        batch_size=batch_size,
+        low_memory=low_memory,
+        rechunk=False,
+        ignore_errors=True,
+    )
+
+    # Project early, so unused fields are never materialized
+    used_columns = _used_columns(merge_config, data.collect_schema().names())
+    if used_columns is not None:
+        data = data.select(used_columns)
+
+    return data
+
+
+def merge_files(  # noqa: PLR0913
     *,
     merge_config: MergeConfig,
     overwrite: bool = False,
     drop_empty: bool = False,
     sort_keys: bool = False,
     progress_bar: bool = False,
+    batch_size: int = 65_536,
+    low_memory: bool = False,
 ) -> None:
     """
     Merge files into one. Execute the following steps:
@@ -32,6 +368,10 @@ def merge_files(
     - Sort the output by keys, latest, or fields
     - Select only specified fields or exclude some fields
     - For each row, remove empty fields and sort keys alphabetically
+
+    Lower batch_size and enable low_memory to reduce memory usage when
+    scanning the input files, at the expense of speed. The progress bar is
+    only shown while removing empty fields, the only step done row by row.
     """
 
     if (
@@ -55,17 +395,14 @@ def merge_files(
         out_path,
     )
 
-    if not overwrite and out_path.exists():
-        LOGGER.warning("Output file already exists, use overwrite to replace it")
+    if skip_existing(out_path, overwrite=overwrite):
         return
 
-    data = pl.scan_ndjson(
-        source=in_paths,
-        schema=merge_config.schema,
-        batch_size=512,
-        low_memory=True,
-        rechunk=True,
-        ignore_errors=True,
+    data = _scan(
+        merge_config,
+        in_paths=in_paths,
+        batch_size=batch_size,
+        low_memory=low_memory,
     )
 
     latest_col = (
@@ -82,16 +419,22 @@ def merge_files(
         if isinstance(merge_config.key_col, list)
         else [merge_config.key_col]
     )
-    key_col_dict = {f"__key__{i}": key for i, key in enumerate(key_col)}
 
     LOGGER.info("Merging rows with identical keys: %s", key_col)
     LOGGER.info("Keeping latest by: %s", latest_col)
 
-    data = (
-        data.sort(by=latest_col, descending=True, nulls_last=True)
-        .with_columns(**key_col_dict)
-        .unique(subset=list(key_col_dict), keep="first")
-        .drop(key_col_dict.keys())
+    # Find the index of the latest row per group instead of sorting all rows
+    # by latest_col, then keep those rows. Gathering only the index per group
+    # is much cheaper than gathering every column.
+    latest_idx = (
+        _latest_expr(latest_col).arg_sort(descending=True, nulls_last=True).first()
+    )
+    data = data.with_row_index("__row__")
+    latest_rows = data.group_by(_group_keys(key_col)).agg(
+        pl.col("__row__").get(latest_idx),
+    )
+    data = data.join(latest_rows.select("__row__"), on="__row__", how="semi").drop(
+        "__row__",
     )
 
     if merge_config.sort_fields is not None:
@@ -112,40 +455,58 @@ def merge_files(
         LOGGER.info("Excluding fields: %s", merge_config.fieldnames_exclude)
         data = data.select(pl.exclude(merge_config.fieldnames_exclude))
 
-    LOGGER.info("Collecting results, this may take a while…")
-    result = data.collect()
-    LOGGER.info("Finished collecting results with shape %dx%d", *result.shape)
-    num_rows = len(result)
+    if drop_empty or sort_keys:
+        data = data.select(
+            _clean_exprs(
+                data.collect_schema(),
+                drop_empty=drop_empty,
+                sort_keys=sort_keys,
+            ),
+        )
 
-    if not drop_empty and not sort_keys:
+    # Unless null fields have to be removed, Polars writes the output directly
+    if not drop_empty:
         LOGGER.info("Writing merged data to <%s>", out_path)
-        result.write_ndjson(out_path)
+        _sink_ndjson(data, out_path=out_path)
         LOGGER.info("Done.")
         return
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_file = Path(temp_dir) / "merged.jl"
-        LOGGER.info("Writing merged data to <%s>", temp_file)
-        result.write_ndjson(temp_file)
-        del result
-
-        LOGGER.info("Writing cleaned data to <%s>", out_path)
-        with temp_file.open("r") as in_file, out_path.open("w") as out_file:
-            lines = (
-                tqdm(
-                    in_file,
-                    desc="Cleaning data",
-                    unit=" rows",
-                    total=num_rows,
-                )
-                if progress_bar
-                else in_file
-            )
-            for line in lines:
-                row = json.loads(line)
-                if drop_empty:
-                    row = {k: v for k, v in row.items() if v}
-                json.dump(row, out_file, sort_keys=sort_keys, separators=(",", ":"))
-                out_file.write("\n")
+    LOGGER.info("Collecting results, this may take a while…")
+    result = data.collect()
+    LOGGER.info("Finished collecting results with shape %dx%d", *result.shape)
 
+    _write_non_null(result, out_path=out_path, progress_bar=progress_bar)
     LOGGER.info("Done.")
+
+
+def _init_worker(log_level: int, log_format: str) -> None:
+    logging.basicConfig(level=log_level, format=log_format, stream=sys.stdout)
+
+
+def merge_files_parallel(
+    *,
+    merge_configs: Iterable[MergeConfig],
+    max_workers: int,
+    log_level: int = logging.INFO,
+    log_format: str = logging.BASIC_FORMAT,
+    **kwargs: Any,
+) -> None:
+    """
+    Run merge_files for independent configs (disjoint inputs and outputs) in a
+    process pool. Workers log to stdout with the given level and format. The
+    first error raised by any merge is re-raised.
+    """
+
+    # Polars is multithreaded, so start fresh processes rather than forking
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(log_level, log_format),
+    ) as executor:
+        futures = [
+            executor.submit(merge_files, merge_config=merge_config, **kwargs)
+            for merge_config in merge_configs
+        ]
+        for future in as_completed(futures):
+            future.result()
@@ -1,5 +1,17 @@
 import polars as pl
 
+# Nested dtypes shared by several schemas
+_FILE_STRUCT = pl.Struct(
+    {
+        "url": pl.String,
+        "path": pl.String,
+        "checksum": pl.String,
+    },
+)
+_BLURHASH_STRUCT = pl.Struct([*_FILE_STRUCT.fields, pl.Field("blurhash", pl.String)])
+_FILE_LIST = pl.List(_FILE_STRUCT)
+_BLURHASH_LIST = pl.List(_BLURHASH_STRUCT)
+
 GAME_ITEM_SCHEMA = pl.Schema(
     {  # type: ignore[arg-type]
         "name": pl.String,
@@ -14,36 +26,11 @@ GAME_ITEM_SCHEMA = pl.Schema(
         "official_url": pl.List(pl.String),
         "image_url": pl.List(pl.String),
         "image_url_download": pl.List(pl.String),
-        "image_file": pl.List(
-            pl.Struct(
-                {
-                    "url": pl.String,
-                    "path": pl.String,
-                    "checksum": pl.String,
-                },
-            ),
-        ),
-        "image_blurhash": pl.List(
-            pl.Struct(
-                {
-                    "url": pl.String,
-                    "path": pl.String,
-                    "checksum": pl.String,
-                    "blurhash": pl.String,
-                },
-            ),
-        ),
+        "image_file": _FILE_LIST,
+        "image_blurhash": _BLURHASH_LIST,
         "video_url": pl.List(pl.String),
         "rules_url": pl.List(pl.String),
-        "rules_file": pl.List(
-            pl.Struct(
-                {
-                    "url": pl.String,
-                    "path": pl.String,
-                    "checksum": pl.String,
-                },
-            ),
-        ),
+        "rules_file": _FILE_LIST,
         "review_url": pl.List(pl.String),
         "external_link": pl.List(pl.String),
         "list_price": pl.String,
@@ -120,25 +107,8 @@ USER_ITEM_SCHEMA = pl.Schema(
         "external_link": pl.List(pl.String),
         "image_url": pl.List(pl.String),
         "image_url_download": pl.List(pl.String),
-        "image_file": pl.List(
-            pl.Struct(
-                {
-                    "url": pl.String,
-                    "path": pl.String,
-                    "checksum": pl.String,
-                },
-            ),
-        ),
-        "image_blurhash": pl.List(
-            pl.Struct(
-                {
-                    "url": pl.String,
-                    "path": pl.String,
-                    "checksum": pl.String,
-                    "blurhash": pl.String,
-                },
-            ),
-        ),
+        "image_file": _FILE_LIST,
+        "image_blurhash": _BLURHASH_LIST,
         "published_at": pl.String,
         "updated_at": pl.String,
         "scraped_at": pl.String,
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Literal
+
+if TYPE_CHECKING:
+    from collections.abc import Generator, Iterable
+
+# Sites merged by default, in this order
+ALL_SITES = ("bgg_hotness", "dbpedia", "luding", "spielen", "wikidata", "bgg")
+
+# Items to merge per site, GameItem only for sites not listed here
+_SITE_ITEMS: dict[str, tuple[Literal["GameItem", "UserItem", "RatingItem"], ...]] = {
+    "bgg": ("GameItem", "UserItem", "RatingItem"),
+}
+
+
+def items_for(site: str) -> tuple[Literal["GameItem", "UserItem", "RatingItem"], ...]:
+    """Item types available for a site."""
+
+    return _SITE_ITEMS.get(site, ("GameItem",))
+
+
+def site_items(
+    sites: Iterable[str] | None = None,
+) -> Generator[tuple[str, Literal["GameItem", "UserItem", "RatingItem"]], None, None]:
+    """Pairs of site and item type to merge, by default for all sites."""
+
+    for site in sites or ALL_SITES:
+        for item in items_for(site):
+            yield site, item
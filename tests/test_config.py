@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+import polars as pl
+import pytest
+
+from board_game_merger.config import DATA_DIR, FEEDS_DIR, MergeConfig
+from board_game_merger.schemas import GAME_ITEM_SCHEMA, USER_ITEM_SCHEMA
+from board_game_merger.sites import site_items
+
+
+def test_site_config_defaults() -> None:
+    config = MergeConfig.site_config(site="luding", out_path="out.jl")
+
+    assert config.schema is GAME_ITEM_SCHEMA
+    assert config.key_col == "luding_id"
+    assert str(config.in_paths).endswith("/board-game-scraper/feeds/luding/GameItem")
+    assert config.sort_fields is None
+    assert config.fieldnames_exclude is None
+
+
+def test_site_config_bgg_user_item() -> None:
+    config = MergeConfig.site_config(
+        site="bgg",
+        item="UserItem",
+        out_path="out.jl",
+        clean_results=True,
+    )
+
+    assert config.schema is USER_ITEM_SCHEMA
+    assert isinstance(config.key_col, list)
+    assert len(config.key_col) == 1
+    key = config.key_col[0]
+    assert isinstance(key, pl.Expr)
+    assert key.meta.root_names() == ["bgg_user_name"]
+    assert config.fieldnames_exclude == ["published_at", "scraped_at"]
+
+
+def test_site_config_bgg_hotness() -> None:
+    config = MergeConfig.site_config(site="bgg_hotness", clean_results=True)
+
+    assert isinstance(config.key_col, list)
+    assert config.key_col[1] == "bgg_id"
+    assert config.fieldnames_exclude is None
+    assert config.fieldnames_include == [
+        "published_at",
+        "rank",
+        "add_rank",
+        "bgg_id",
+        "name",
+        "year",
+        "image_url",
+    ]
+    assert str(config.out_path).endswith("/scraped/bgg_hotness_GameItem.jl")
+
+
+@pytest.mark.parametrize(
+    ("site", "item"),
+    [
+        ("luding", "UserItem"),
+        ("bgg_hotness", "RatingItem"),
+        ("bgg", "FooItem"),
+    ],
+)
+def test_site_config_unknown_item(site: str, item: str) -> None:
+    with pytest.raises(ValueError, match="Unknown item type"):
+        MergeConfig.site_config(site=site, item=item)  # type: ignore[arg-type]
+
+
+def test_with_defaults_custom_key() -> None:
+    latest_col = pl.col("updated_at")
+    config = MergeConfig.with_defaults(
+        site="bgg",
+        key_col="name",
+        latest_col=latest_col,
+        out_path="out.jl",
+    )
+
+    assert config.key_col == "name"
+    assert config.latest_col is latest_col
+
+
+def test_with_defaults_converts_schema() -> None:
+    config = MergeConfig.with_defaults(
+        site="luding",
+        schema={"luding_id": pl.Int64, "name": pl.String},
+        out_path="out.jl",
+    )
+
+    assert isinstance(config.schema, pl.Schema)
+    assert config.schema == pl.Schema({"luding_id": pl.Int64, "name": pl.String})
+
+
+def test_with_defaults_unknown_item() -> None:
+    with pytest.raises(ValueError, match="Unknown item type: FooItem"):
+        MergeConfig.with_defaults(site="luding", item="FooItem")  # type: ignore[arg-type]
+
+
+def test_all_sites_config_shares_timestamp() -> None:
+    configs = list(MergeConfig.all_sites_config())
+
+    assert [Path(config.out_path).parent for config in configs] == [
+        FEEDS_DIR / site / item for site, item in site_items()
+    ]
+    assert len({Path(config.out_path).name for config in configs}) == 1
+    assert [site for site, _ in site_items()] == [
+        "bgg_hotness",
+        "dbpedia",
+        "luding",
+        "spielen",
+        "wikidata",
+        "bgg",
+        "bgg",
+        "bgg",
+    ]
+
+
+def test_default_out_path() -> None:
+    now = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+    assert MergeConfig.default_out_path("luding", now=now) == (
+        FEEDS_DIR / "luding" / "GameItem" / "2024-01-02T03-04-05-merged.jl"
+    )
+    assert MergeConfig.default_out_path(
+        "bgg",
+        item="UserItem",
+        clean_results=True,
+        now=now,
+    ) == (DATA_DIR / "scraped" / "bgg_UserItem.jl")
+
+
+@pytest.mark.parametrize(
+    ("kwargs", "latest_min"),
+    [
+        ({}, None),
+        ({"latest_min_days": 0}, None),
+        ({"latest_min_days": 1.5}, datetime(2024, 1, 1, 12, tzinfo=timezone.utc)),
+        # An explicit latest_min takes precedence
+        ({"latest_min_days": 1.5, "latest_min": "2020-01-01"}, "2020-01-01"),
+    ],
+)
+def test_with_defaults_latest_min(kwargs: dict[str, Any], latest_min: Any) -> None:
+    config = MergeConfig.with_defaults(
+        site="luding",
+        now=datetime(2024, 1, 3, tzinfo=timezone.utc),
+        **kwargs,
+    )
+
+    assert config.latest_min == latest_min
@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import logging
+import runpy
+import subprocess
+import sys
+from typing import TYPE_CHECKING
+
+import pytest
+
+from board_game_merger import __main__, config
+from board_game_merger.__main__ import (
+    _build_parser,
+    _parse_args,
+    _parse_args_fast,
+    main,
+)
+from board_game_merger.config import MergeConfig
+from board_game_merger.sites import site_items
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["bgg"],
+        ["bgg", "luding", "dbpedia"],
+        ["all", "-c", "-m", "30"],
+        ["bgg", "-t", "RatingItem", "-i", "a", "b", "-o", "x.jl", "-W", "-p", "-v"],
+        ["-t", "UserItem", "bgg", "--in-paths", "a", "--clean-results"],
+        # Bundled flags
+        ["bgg", "-cW"],
+        ["bgg", "-cWpv", "-t", "UserItem"],
+        ["bgg", "--batch-size=7", "-clW"],
+        # --option=value
+        ["bgg", "--latest-min-days=2.5"],
+        ["bgg", "-j", "3", "--workers=2"],
+        ["bgg", "--item-type=UserItem", "--out-path=x.jl"],
+        # Sites before or after all options
+        ["bgg", "luding", "-c"],
+        ["-c", "bgg", "luding", "-t", "GameItem"],
+        ["bgg", "-i", "a", "luding"],
+    ],
+)
+def test_parse_args_fast_matches_argparse(argv: list[str]) -> None:
+    fast = _parse_args_fast(argv)
+    assert fast is not None
+    assert vars(fast) == vars(_build_parser().parse_args(argv))
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        # Negative numbers look like options
+        ["bgg", "-m", "-1"],
+        ["bgg", "--out-path=-x", "-c"],
+        ["bgg", "-tUserItem"],
+        ["bgg", "--", "luding"],
+    ],
+)
+def test_parse_args_falls_back_to_argparse(argv: list[str]) -> None:
+    assert _parse_args_fast(argv) is None
+    assert vars(_parse_args(argv)) == vars(_build_parser().parse_args(argv))
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        # Sites interleaved with options
+        ["bgg", "-c", "luding"],
+        ["bgg", "--clean", "luding"],
+        ["bgg", "-t", "GameItem", "luding"],
+        # Invalid values
+        ["bgg", "-t", "Foo"],
+        ["bgg", "-m", "x"],
+        ["bgg", "-i"],
+        [],
+        # Explicit paths with several sites
+        ["bgg", "luding", "-o", "x.jl"],
+        ["all", "-i", "a"],
+        # Non-positive numbers
+        ["bgg", "-b", "0"],
+        ["bgg", "--batch-size=-512"],
+        ["bgg", "--workers", "0"],
+        ["bgg", "-j", "-2"],
+        # 'all' with other sites
+        ["all", "luding"],
+        ["bgg", "all"],
+    ],
+)
+def test_parse_args_errors(argv: list[str]) -> None:
+    with pytest.raises(SystemExit):
+        _parse_args(argv)
+
+
+@pytest.mark.parametrize(
+    ("argv", "invalid"),
+    [
+        (["luding", "bgg", "-t", "UserItem"], "luding"),
+        (["bgg", "luding", "wikidata", "-t", "RatingItem"], "luding, wikidata"),
+        (["bgg_hotness", "-t", "UserItem"], "bgg_hotness"),
+    ],
+)
+def test_parse_args_invalid_site_items(
+    argv: list[str],
+    invalid: str,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    with pytest.raises(SystemExit):
+        _parse_args(argv)
+    assert capsys.readouterr().err.endswith(f"is not available for {invalid}\n")
+
+
+@pytest.fixture
+def data_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.setattr(config, "_FEEDS_DIR_STR", str(tmp_path / "feeds"))
+    monkeypatch.setattr(config, "_DATA_DIR_STR", str(tmp_path / "data"))
+    return tmp_path / "data"
+
+
+def _main(monkeypatch: pytest.MonkeyPatch, *argv: str) -> None:
+    monkeypatch.setattr(sys, "argv", ["board_game_merger", *argv])
+    main()
+
+
+@pytest.mark.parametrize(
+    ("argv", "num_skipped"),
+    [
+        (["all", "-c"], len(list(site_items()))),
+        (["luding", "bgg", "-c"], 2),
+        (["bgg", "-t", "UserItem", "-c", "-j", "2"], 1),
+        (["luding", "-o", "{data_dir}/scraped/luding_GameItem.jl"], 1),
+    ],
+)
+def test_main_skips_existing_outputs(
+    argv: list[str],
+    num_skipped: int,
+    data_dir: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    (data_dir / "scraped").mkdir(parents=True)
+    for site, item in site_items():
+        (data_dir / "scraped" / f"{site}_{item}.jl").write_text("existing\n")
+
+    # Neither the current time nor configs are needed for skipped outputs
+    monkeypatch.setattr(__main__, "datetime", None)
+    monkeypatch.setattr(
+        MergeConfig, "site_config", lambda **_: pytest.fail("config built")
+    )
+
+    with caplog.at_level(logging.WARNING):
+        _main(monkeypatch, *(arg.format(data_dir=data_dir) for arg in argv))
+
+    skipped = [
+        record for record in caplog.records if "already exists" in record.message
+    ]
+    assert len(skipped) == num_skipped
+
+
+def test_main_merges_sites(
+    data_dir: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    in_path = data_dir.parent / "games.jl"
+    in_path.write_text(
+        '{"luding_id": 1, "name": "Old", "scraped_at": "2024-01-01T00:00:00Z"}\n'
+        '{"luding_id": 1, "name": "New", "scraped_at": "2024-02-01T00:00:00Z"}\n'
+        '{"luding_id": 2, "name": "", "scraped_at": "2024-01-01T00:00:00Z"}\n',
+    )
+
+    (data_dir / "scraped").mkdir(parents=True)
+
+    _main(monkeypatch, "luding", "--clean-results", "-i", str(in_path))
+
+    assert (data_dir / "scraped" / "luding_GameItem.jl").read_text() == (
+        '{"luding_id":1,"name":"New"}\n{"luding_id":2}\n'
+    )
+
+
+@pytest.mark.parametrize("argv", [["--help"], ["all", "luding"]])
+def test_cli_exits_without_loading_polars(argv: list[str]) -> None:
+    code = (
+        "import runpy, sys\n"
+        f"sys.argv = ['board_game_merger', *{argv!r}]\n"
+        "try:\n"
+        "    runpy.run_module('board_game_merger', run_name='__main__')\n"
+        "except SystemExit:\n"
+        "    print('polars' in sys.modules)\n"
+    )
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", code],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    assert result.stdout.splitlines()[-1] == "False"
+
+
+def test_main_module(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(sys, "argv", ["board_game_merger", "--help"])
+    # Run the module fresh, like python -m does
+    monkeypatch.delitem(sys.modules, "board_game_merger.__main__")
+    with pytest.raises(SystemExit, match="0"):
+        runpy.run_module("board_game_merger", run_name="__main__")
+
+
+def test_main_configures_logging(
+    data_dir: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    root = logging.getLogger()
+    monkeypatch.setattr(root, "handlers", [])
+    monkeypatch.setattr(root, "level", logging.WARNING)
+    (data_dir / "scraped").mkdir(parents=True)
+    (data_dir / "scraped" / "luding_GameItem.jl").write_text("existing\n")
+
+    _main(monkeypatch, "luding", "-c", "-v")
+
+    assert root.level == logging.DEBUG
+    assert len(root.handlers) == 1
+    handler = root.handlers[0]
+    assert isinstance(handler, logging.StreamHandler)
+    assert handler.formatter is not None
+    assert handler.formatter._fmt == __main__._LOG_FORMAT  # noqa: SLF001
@@ -0,0 +1,413 @@
+from __future__ import annotations
+
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+import polars as pl
+import pytest
+
+from board_game_merger import merge
+from board_game_merger.config import MergeConfig
+from board_game_merger.merge import (
+    _available_cpus,
+    _clean_exprs,
+    _scan,
+    _sink_ndjson,
+    _used_columns,
+    _write_non_null,
+    merge_files,
+    merge_files_parallel,
+)
+from board_game_merger.schemas import USER_ITEM_SCHEMA
+
+USERS = [
+    {
+        "bgg_user_name": "Alice",
+        "city": "Old",
+        "scraped_at": "2024-01-01T00:00:00Z",
+    },
+    {
+        "bgg_user_name": "alice",
+        "city": "New",
+        "country": "",
+        "registered": 0,
+        "external_link": [],
+        "image_file": [{"url": "u", "path": "p", "checksum": "c"}],
+        "scraped_at": "2024-02-01T00:00:00Z",
+    },
+    # Rows without scraped_at are only kept if there's no other row
+    {"bgg_user_name": "ALICE", "city": "Unknown"},
+    {"bgg_user_name": "Bob", "city": "Somewhere"},
+]
+
+
+@pytest.fixture
+def in_path(tmp_path: Path) -> Path:
+    path = tmp_path / "UserItem"
+    path.mkdir()
+    with (path / "users.jl").open("w") as file:
+        for user in USERS:
+            file.write(json.dumps(user) + "\n")
+    return path
+
+
+def _merge(in_path: Path, out_path: Path, **kwargs: Any) -> list[dict[str, Any]]:
+    merge_config = MergeConfig.site_config(
+        site="bgg",
+        item="UserItem",
+        in_paths=in_path,
+        out_path=out_path,
+    )
+    merge_files(merge_config=merge_config, **kwargs)
+    return _read_rows(out_path)
+
+
+def _read_rows(out_path: Path) -> list[dict[str, Any]]:
+    with out_path.open() as file:
+        rows = [json.loads(line) for line in file]
+    return sorted(rows, key=lambda row: row["bgg_user_name"])
+
+
+def test_merge_keeps_latest_row_per_key(in_path: Path, tmp_path: Path) -> None:
+    rows = _merge(in_path, tmp_path / "out.jl")
+
+    assert [(row["bgg_user_name"], row["city"]) for row in rows] == [
+        ("Bob", "Somewhere"),
+        ("alice", "New"),
+    ]
+    # Without cleanup all fields are written, including nulls
+    assert rows[0]["country"] is None
+    assert rows[1]["country"] == ""
+
+
+@pytest.mark.parametrize(
+    ("latest_col", "city"),
+    [
+        # Plain column, compared as strings
+        ("last_login", "Second"),
+        # Several columns, compared in order and with nulls last in each
+        (["registered", "last_login"], "Third"),
+        ([pl.col("registered"), pl.col("last_login").str.to_uppercase()], "Third"),
+    ],
+)
+def test_merge_latest_col(
+    latest_col: Any,
+    city: str,
+    tmp_path: Path,
+) -> None:
+    rows: list[dict[str, Any]] = [
+        {"city": "First", "registered": 2},
+        {"city": "Second", "last_login": "c"},
+        {"city": "Third", "registered": 2, "last_login": "b"},
+        {"city": "Fourth", "registered": 1, "last_login": "a"},
+    ]
+    in_path = tmp_path / "users.jl"
+    in_path.write_text(
+        "".join(json.dumps({"bgg_user_name": "a", **row}) + "\n" for row in rows)
+    )
+    out_path = tmp_path / "out.jl"
+    merge_config = MergeConfig.site_config(
+        site="bgg",
+        item="UserItem",
+        in_paths=in_path,
+        out_path=out_path,
+        latest_col=latest_col,
+    )
+    merge_files(merge_config=merge_config, drop_empty=True)
+
+    assert [row["city"] for row in _read_rows(out_path)] == [city]
+
+
+def test_merge_clean_results_prunes_scan(in_path: Path, tmp_path: Path) -> None:
+    merge_config = MergeConfig.site_config(
+        site="bgg",
+        item="UserItem",
+        in_paths=in_path,
+        out_path=tmp_path / "out.jl",
+        clean_results=True,
+    )
+
+    # scraped_at is needed to find the latest row, but it isn't written
+    data = _scan(merge_config, in_paths=[in_path], batch_size=512, low_memory=False)
+    assert data.collect_schema().names() == [
+        name for name in USER_ITEM_SCHEMA.names() if name != "published_at"
+    ]
+
+    merge_files(merge_config=merge_config)
+    rows = _read_rows(tmp_path / "out.jl")
+    assert [row["bgg_user_name"] for row in rows] == ["Bob", "alice"]
+    assert list(rows[0]) == [
+        name
+        for name in USER_ITEM_SCHEMA.names()
+        if name not in {"published_at", "scraped_at"}
+    ]
+
+
+def test_merge_schema_mapping(tmp_path: Path) -> None:
+    in_path = tmp_path / "games.jl"
+    in_path.write_text(
+        '{"id": 1, "name": "a", "extra": "x"}\n{"id": 1, "name": "b", "extra": "y"}\n',
+    )
+    merge_config = MergeConfig(
+        schema={"id": pl.Int64, "name": pl.String, "extra": pl.String},  # type: ignore[arg-type]
+        in_paths=in_path,
+        out_path=tmp_path / "out.jl",
+        key_col="id",
+        latest_col="name",
+        fieldnames_exclude=["extra"],
+    )
+    merge_files(merge_config=merge_config)
+
+    assert (tmp_path / "out.jl").read_text() == '{"id":1,"name":"b"}\n'
+
+
+@pytest.mark.parametrize(
+    ("kwargs", "used_columns"),
+    [
+        ({}, None),
+        ({"fieldnames_include": ["a"]}, ["a", "b", "c"]),
+        ({"fieldnames_include": [pl.col("a").alias("x"), "d"]}, ["a", "b", "c", "d"]),
+        ({"fieldnames_exclude": ["a", "b"]}, ["b", "c", "d"]),
+        ({"fieldnames_exclude": "d", "sort_fields": pl.col("a")}, ["a", "b", "c"]),
+        # Literals don't need any columns
+        ({"fieldnames_include": "a", "latest_col": ["c", 1]}, ["a", "b", "c"]),
+        # Columns selected by pattern or wildcard can't be resolved up front
+        ({"fieldnames_exclude": "^[ab]$"}, None),
+        ({"fieldnames_include": pl.all()}, None),
+        ({"fieldnames_include": ["a"], "sort_fields": pl.exclude("a")}, None),
+    ],
+)
+def test_used_columns(kwargs: dict[str, Any], used_columns: list[str] | None) -> None:
+    merge_config = MergeConfig(
+        **{
+            "schema": pl.Schema(dict.fromkeys("abcd", pl.String)),
+            "in_paths": "in.jl",
+            "out_path": "out.jl",
+            "key_col": "b",
+            "latest_col": pl.col("c").str.to_uppercase(),
+            **kwargs,
+        },
+    )
+
+    assert _used_columns(merge_config, list("abcd")) == used_columns
+
+
+def test_merge_latest_min(in_path: Path, tmp_path: Path) -> None:
+    merge_config = MergeConfig.site_config(
+        site="bgg",
+        item="UserItem",
+        in_paths=in_path,
+        out_path=tmp_path / "out.jl",
+        latest_min=datetime(2024, 1, 15, tzinfo=timezone.utc),
+    )
+    merge_files(merge_config=merge_config, drop_empty=True)
+
+    rows = _read_rows(tmp_path / "out.jl")
+    assert [(row["bgg_user_name"], row["city"]) for row in rows] == [("alice", "New")]
+
+
+def test_merge_fieldnames_include(in_path: Path, tmp_path: Path) -> None:
+    merge_config = MergeConfig.site_config(
+        site="bgg",
+        item="UserItem",
+        in_paths=in_path,
+        out_path=tmp_path / "out.jl",
+        fieldnames_include=["city", "bgg_user_name"],
+    )
+    merge_files(merge_config=merge_config)
+
+    rows = _read_rows(tmp_path / "out.jl")
+    # Fields are written in the given order
+    assert [list(row.items()) for row in rows] == [
+        [("city", "Somewhere"), ("bgg_user_name", "Bob")],
+        [("city", "New"), ("bgg_user_name", "alice")],
+    ]
+
+
+def test_merge_include_and_exclude(in_path: Path, tmp_path: Path) -> None:
+    merge_config = MergeConfig.site_config(
+        site="bgg",
+        item="UserItem",
+        in_paths=in_path,
+        out_path=tmp_path / "out.jl",
+        fieldnames_include=["bgg_user_name"],
+        fieldnames_exclude=["city"],
+    )
+
+    with pytest.raises(ValueError, match="Cannot specify both"):
+        merge_files(merge_config=merge_config)
+
+
+def test_merge_drop_empty(in_path: Path, tmp_path: Path) -> None:
+    rows = _merge(in_path, tmp_path / "out.jl", drop_empty=True)
+
+    assert rows[0] == {"bgg_user_name": "Bob", "city": "Somewhere"}
+    assert rows[1]["city"] == "New"
+    assert "country" not in rows[1]
+    assert "external_link" not in rows[1]
+    assert rows[1]["image_file"] == [{"url": "u", "path": "p", "checksum": "c"}]
+
+
+def test_merge_drop_empty_keeps_zero(in_path: Path, tmp_path: Path) -> None:
+    rows = _merge(in_path, tmp_path / "out.jl", drop_empty=True)
+
+    assert rows[1] == {
+        "bgg_user_name": "alice",
+        "city": "New",
+        "registered": 0,
+        "image_file": [{"url": "u", "path": "p", "checksum": "c"}],
+        "scraped_at": "2024-02-01T00:00:00Z",
+    }
+
+
+def test_clean_exprs_by_dtype() -> None:
+    data = pl.DataFrame(
+        {
+            "string": ["", " ", None],
+            "list": [[], [""], None],
+            "int": [0, 1, None],
+            "float": [0.0, -0.0, None],
+            "bool": [False, True, None],
+        },
+    )
+    cleaned = data.select(
+        _clean_exprs(data.schema, drop_empty=True, sort_keys=False),
+    )
+
+    # Only empty strings and lists count as empty, zero and false are values
+    assert cleaned.to_dicts() == [
+        {"string": None, "list": None, "int": 0, "float": 0.0, "bool": False},
+        {"string": " ", "list": [""], "int": 1, "float": -0.0, "bool": True},
+        dict.fromkeys(data.columns),
+    ]
+
+
+def test_merge_sort_keys(in_path: Path, tmp_path: Path) -> None:
+    rows = _merge(in_path, tmp_path / "out.jl", drop_empty=True, sort_keys=True)
+
+    for row in rows:
+        assert list(row) == sorted(row)
+    assert list(rows[1]["image_file"][0]) == ["checksum", "path", "url"]
+
+
+def test_merge_sort_keys_without_drop_empty(in_path: Path, tmp_path: Path) -> None:
+    rows = _merge(in_path, tmp_path / "out.jl", sort_keys=True)
+
+    # Polars writes null fields, but keys and nested keys are still sorted
+    assert list(rows[0]) == sorted(USER_ITEM_SCHEMA.names())
+    assert rows[0]["image_file"] is None
+    assert list(rows[1]["image_file"][0]) == ["checksum", "path", "url"]
+
+
+def test_sink_ndjson(tmp_path: Path) -> None:
+    out_path = tmp_path / "out.jl"
+    _sink_ndjson(pl.LazyFrame({"id": [1, 2], "name": ["a", None]}), out_path=out_path)
+
+    assert out_path.read_text() == '{"id":1,"name":"a"}\n{"id":2,"name":null}\n'
+
+
+def test_sink_ndjson_collects_if_not_streamable(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    def sink_ndjson(*args: Any, **kwargs: Any) -> None:
+        raise pl.exceptions.InvalidOperationError
+
+    monkeypatch.setattr(pl.LazyFrame, "sink_ndjson", sink_ndjson)
+    out_path = tmp_path / "out.jl"
+    _sink_ndjson(pl.LazyFrame({"id": [1, 2]}), out_path=out_path)
+
+    assert out_path.read_text() == '{"id":1}\n{"id":2}\n'
+
+
+def test_merge_does_not_overwrite(in_path: Path, tmp_path: Path) -> None:
+    out_path = tmp_path / "out.jl"
+    out_path.write_text("existing\n")
+
+    merge_config = MergeConfig.site_config(
+        site="bgg",
+        item="UserItem",
+        in_paths=in_path,
+        out_path=out_path,
+    )
+    merge_files(merge_config=merge_config)
+    assert out_path.read_text() == "existing\n"
+
+    rows = _merge(in_path, out_path, overwrite=True)
+    assert [row["bgg_user_name"] for row in rows] == ["Bob", "alice"]
+
+
+def test_write_non_null_in_process_pool(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    data = pl.DataFrame(
+        {
+            "id": range(100),
+            "name": [None if i % 3 else f"name {i}" for i in range(100)],
+            "empty": [None] * 100,
+        },
+        schema_overrides={"empty": pl.String},
+    )
+    serial_path = tmp_path / "serial.jl"
+    _write_non_null(data, out_path=serial_path, progress_bar=False)
+
+    monkeypatch.setattr(merge, "orjson", None)
+    monkeypatch.setattr(merge, "PARALLEL_DUMPS_MIN_ROWS", 10)
+    monkeypatch.setattr(merge, "DUMPS_CHUNK_ROWS", 7)
+    monkeypatch.setattr(merge, "_available_cpus", lambda: 2)
+    parallel_path = tmp_path / "parallel.jl"
+    _write_non_null(data, out_path=parallel_path, progress_bar=False)
+
+    assert parallel_path.read_bytes() == serial_path.read_bytes()
+    assert serial_path.read_text().splitlines()[:2] == [
+        '{"id":0,"name":"name 0"}',
+        '{"id":1}',
+    ]
+
+
+def test_available_cpus(monkeypatch: pytest.MonkeyPatch) -> None:
+    cpus = {0, 2, 5}
+    monkeypatch.setattr(os, "sched_getaffinity", lambda _: cpus, raising=False)
+    assert _available_cpus() == len(cpus)
+
+    monkeypatch.delattr(os, "sched_getaffinity")
+    monkeypatch.setattr(os, "cpu_count", lambda: None)
+    assert _available_cpus() == 1
+
+
+@pytest.mark.parametrize("json_module", ["orjson", None])
+def test_write_non_null_utf8(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    json_module: str | None,
+) -> None:
+    if json_module is None:
+        monkeypatch.setattr(merge, "orjson", None)
+    else:
+        monkeypatch.setattr(merge, "orjson", pytest.importorskip(json_module))
+    data = pl.DataFrame({"name": ["Über", None], "rating": [7.5, None]})
+    out_path = tmp_path / "out.jl"
+    _write_non_null(data, out_path=out_path, progress_bar=False)
+
+    assert out_path.read_text(encoding="utf-8") == '{"name":"Über","rating":7.5}\n{}\n'
+
+
+def test_merge_files_parallel(in_path: Path, tmp_path: Path) -> None:
+    merge_configs = [
+        MergeConfig.site_config(
+            site="bgg",
+            item=item,
+            in_paths=in_path,
+            out_path=tmp_path / f"{item}.jl",
+        )
+        for item in ("UserItem", "RatingItem")
+    ]
+    merge_files_parallel(merge_configs=merge_configs, max_workers=2, drop_empty=True)
+
+    for merge_config in merge_configs:
+        rows = _read_rows(Path(merge_config.out_path))
+        assert [row["bgg_user_name"] for row in rows] == ["Bob", "alice"]